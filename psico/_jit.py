@@ -0,0 +1,164 @@
+'''
+Numba compiled kernels for the numeric hot loops of psico.
+
+Importing this module raises ImportError if numba is not available, callers
+are expected to fall back to their numpy implementation in that case.
+
+License: BSD-2-Clause
+'''
+
+from math import sqrt
+
+import numpy
+from numba import njit
+
+
+@njit(cache=True)
+def _sv_sum(M):
+    '''
+    Sum of the singular values of a 3x3 matrix, by one-sided Jacobi
+    rotations of the columns of M (Hestenes). Unlike the eigenvalues of
+    M.T * M, the column norms keep the accuracy of numpy's SVD for small
+    singular values (near planar or collinear coordinates).
+    '''
+    A = M.copy()
+
+    for _ in range(30):
+        rotated = False
+        for p in range(2):
+            for q in range(p + 1, 3):
+                alpha = A[0, p] * A[0, p] + A[1, p] * A[1, p] + A[2, p] * A[2, p]
+                beta = A[0, q] * A[0, q] + A[1, q] * A[1, q] + A[2, q] * A[2, q]
+                gamma = A[0, p] * A[0, q] + A[1, p] * A[1, q] + A[2, p] * A[2, q]
+
+                if abs(gamma) <= 1e-15 * sqrt(alpha * beta):
+                    continue
+
+                rotated = True
+                zeta = (beta - alpha) / (2.0 * gamma)
+                t = 1.0 / (abs(zeta) + sqrt(1.0 + zeta * zeta))
+                if zeta < 0.0:
+                    t = -t
+                c = 1.0 / sqrt(1.0 + t * t)
+                s = c * t
+
+                for k in range(3):
+                    a_p = A[k, p]
+                    A[k, p] = c * a_p - s * A[k, q]
+                    A[k, q] = s * a_p + c * A[k, q]
+
+        if not rotated:
+            break
+
+    total = 0.0
+    for p in range(3):
+        total += sqrt(A[0, p] * A[0, p] + A[1, p] * A[1, p] + A[2, p] * A[2, p])
+    return total
+
+
+@njit(cache=True, fastmath=True)
+def rmsd(X, Y):
+    '''
+    RMSD after optimal superposition of two nx3 arrays.
+    '''
+    n = X.shape[0]
+    mx = numpy.zeros(3)
+    my = numpy.zeros(3)
+
+    for k in range(n):
+        for a in range(3):
+            mx[a] += X[k, a]
+            my[a] += Y[k, a]
+
+    mx /= n
+    my /= n
+
+    R = 0.0
+    M = numpy.zeros((3, 3))
+
+    for k in range(n):
+        x0, x1, x2 = X[k, 0] - mx[0], X[k, 1] - mx[1], X[k, 2] - mx[2]
+        y0, y1, y2 = Y[k, 0] - my[0], Y[k, 1] - my[1], Y[k, 2] - my[2]
+        R += x0 * x0 + x1 * x1 + x2 * x2 + y0 * y0 + y1 * y1 + y2 * y2
+        M[0, 0] += y0 * x0
+        M[0, 1] += y0 * x1
+        M[0, 2] += y0 * x2
+        M[1, 0] += y1 * x0
+        M[1, 1] += y1 * x1
+        M[1, 2] += y1 * x2
+        M[2, 0] += y2 * x0
+        M[2, 1] += y2 * x1
+        M[2, 2] += y2 * x2
+
+    return sqrt(max(R - 2.0 * _sv_sum(M), 0.0) / n)
+
+
+@njit(cache=True, fastmath=True)
+def sv_sum_batch(M):
+    '''
+    Sums of the singular values of a stack of 3x3 matrices.
+    '''
+    out = numpy.empty(M.shape[0])
+    for k in range(M.shape[0]):
+        out[k] = _sv_sum(M[k])
+    return out
+
+
+@njit(cache=True, fastmath=True)
+def apply_transforms(X, R, t, out):
+    '''
+    out[i] = dot(X[i] - t[i], R[i]) for a (m, n, 3) ensemble X with (m, 3, 3)
+    rotations R and (m, 3) translations t.
+    '''
+    for i in range(X.shape[0]):
+        for k in range(X.shape[1]):
+            x0 = X[i, k, 0] - t[i, 0]
+            x1 = X[i, k, 1] - t[i, 1]
+            x2 = X[i, k, 2] - t[i, 2]
+            for a in range(3):
+                out[i, k, a] = x0 * R[i, 0, a] + x1 * R[i, 1, a] + x2 * R[i, 2, a]
+
+
+@njit(cache=True, fastmath=True)
+def mean_var_sum(ensemble):
+    '''
+    Mean structure and per-atom variance (summed over x, y, z) of a
+    (m, n, 3) ensemble. Same as (ensemble.mean(0), ensemble.var(0).sum(1)).
+    '''
+    m, n = ensemble.shape[0], ensemble.shape[1]
+    mean = numpy.empty((n, 3))
+    var = numpy.empty(n)
+    for k in range(n):
+        v = 0.0
+        for a in range(3):
+            s = 0.0
+            q = 0.0
+            for i in range(m):
+                x = ensemble[i, k, a]
+                s += x
+                q += x * x
+            s /= m
+            mean[k, a] = s
+            v += q / m - s * s
+        var[k] = max(v, 0.0)
+    return mean, var
+
+
+@njit(cache=True)
+def aggrescan_a3v_a4v(codes, lut, winsize):
+    '''
+    Aggrescan a3v values (lut lookup of character codes) and their window
+    averages a4v over all complete windows. Windows are summed left to
+    right, like the pure Python implementation.
+    '''
+    n = codes.shape[0]
+    a3v = numpy.empty(n)
+    for k in range(n):
+        a3v[k] = lut[codes[k]]
+    a4v = numpy.empty(max(n - winsize + 1, 0))
+    for i in range(a4v.shape[0]):
+        s = 0.0
+        for k in range(i, i + winsize):
+            s += a3v[k]
+        a4v[i] = s / winsize
+    return a3v, a4v
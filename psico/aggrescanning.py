@@ -11,6 +11,8 @@ devitate from the paper.
 License: BSD-2-Clause
 """
 
+import numpy
+
 from pymol import cmd, CmdException
 
 # Amino-acid aggregation-propensity value (a3v)
@@ -53,6 +55,13 @@ AGGRESCAN_HST = -0.02
 # Minimum number of residues per hotspot
 HS_MIN_RES_COUNT = 5
 
+# a3v lookup table, indexed by the (ASCII) character code. Unexpected codes
+# get the value of alanine.
+_A3V_LUT = numpy.full(256, AGGRESCAN_A3V["A"])
+for _aa, _value in AGGRESCAN_A3V.items():
+    _A3V_LUT[ord(_aa)] = _value
+del _aa, _value
+
 
 def mean(values: list) -> float:
     """Compute the arithmetic mean"""
@@ -117,52 +126,73 @@ def aggrescan1d_scores(seq: str, winsize: int = None) -> dict:
     assert winsize > 2 and winsize % 2 == 1
 
     # amino-acid aggregation-propensity value (a3v)
-    a3v = [AGGRESCAN_A3V.get(aa, AGGRESCAN_A3V["A"]) for aa in seq]
-    a3v_with_termini = [AGGRESCAN_A3V["^"]] + a3v + [AGGRESCAN_A3V["$"]]
-    a4v = [
-        mean(a3v_with_termini[i:i + winsize]) for i in range(N - winsize + 3)
-    ]
+    codes = numpy.frombuffer(("^" + seq + "$").encode("ascii", "replace"),
+                             dtype=numpy.uint8)
+
+    try:
+        from ._jit import aggrescan_a3v_a4v
+    except ImportError:
+        a3v_with_termini = _A3V_LUT[codes]
+        # a3v window average (a4v), windows summed left to right by adding
+        # the shifted profiles (a cumulative sum changes the rounding)
+        n_windows = len(a3v_with_termini) - winsize + 1
+        a4v = a3v_with_termini[:n_windows].copy()
+        for k in range(1, winsize):
+            a4v += a3v_with_termini[k:k + n_windows]
+        a4v /= winsize
+    else:
+        a3v_with_termini, a4v = aggrescan_a3v_a4v(codes, _A3V_LUT, winsize)
 
     # "The remaining off-centre N- and C-terminal residues are assigned the a4v
     # calculated for the first and last window centres, respectively."
     offcenter = winsize // 2 - 1
-    a4v = [a4v[0]] * offcenter + a4v + [a4v[-1]] * offcenter
+    a4v = numpy.pad(a4v, offcenter, "edge")
+    a4v_minus_hst = a4v - AGGRESCAN_HST
+
+    # hot spots: runs of residues above the threshold, prolines break runs
+    is_hs = (a4v_minus_hst > 0) & (codes[1:-1] != ord("P"))
+
+    a3v = a3v_with_termini[1:-1].tolist()
+    a4v = a4v.tolist()
+    a4v_minus_hst = a4v_minus_hst.tolist()
 
     assert len(a3v) == N
     assert len(a4v) == N
 
-    a4v_minus_hst = [(v - AGGRESCAN_HST) for v in a4v]
-
-    nHS = 0  # Number of Hot Spots (nHS)
-    HSA = [0.0] * N  # Hot-Spot Area (HSA)
-    NHSA = [0.0] * N  # Normalized Hot-Spot Area per residue
-    a4vAHS = [0.0] * N  # a4v average in the Hot Spot
-    run_hs = 0
+    edges = numpy.flatnonzero(numpy.diff(is_hs, prepend=False, append=False))
+    starts, ends = edges[0::2].tolist(), edges[1::2].tolist()
+    run_hs = edges[1::2] - edges[0::2]
 
-    for (j, aa) in enumerate(seq + "P"):
-        if aa != "P" and a4v_minus_hst[j] > 0:
-            run_hs += 1
-            continue
+    # per-run sums (only a few runs, summed like before for identical rounding)
+    hsa = numpy.array([sum(a4v_minus_hst[i:j]) for (i, j) in zip(starts, ends)])
+    a4v_hs = numpy.array([mean(a4v[i:j]) for (i, j) in zip(starts, ends)])
 
-        if run_hs > 0:
-            i = j - run_hs
-            hsa = sum(a4v_minus_hst[i:j])  # trapezoidal_integration?
+    # FIXME Needed to match values in web tool
+    if starts and starts[0] == 0:
+        hsa[0] += a4v_minus_hst[0] / 2
 
-            # FIXME Needed to match values in web tool
-            if i == 0:
-                hsa += a4v_minus_hst[0] / 2
+    is_nhs = run_hs >= HS_MIN_RES_COUNT
+    nHS = int(is_nhs.sum())  # Number of Hot Spots (nHS)
 
-            HSA[i:j] = [hsa] * run_hs
-            a4vAHS[i:j] = [mean(a4v[i:j])] * run_hs
+    # per-residue hot spot columns as rows of one array
+    hs_table = numpy.zeros((3, N))
 
-            if run_hs >= HS_MIN_RES_COUNT:
-                NHSA[i:j] = [hsa / run_hs] * run_hs
-                nHS += 1
+    # per-run values for the three columns, spread over the run residues
+    hs_table[:, is_hs] = numpy.repeat(
+        [
+            hsa,  # Hot-Spot Area (HSA)
+            numpy.where(is_nhs, hsa / run_hs, 0.0),  # Normalized HSA per residue
+            a4v_hs,  # a4v average in the Hot Spot
+        ],
+        run_hs,
+        axis=1)
 
-        run_hs = 0
+    HSA, NHSA, a4vAHS = hs_table.tolist()
 
+    # builtin (left to right) sums, numpy's pairwise summation changes the
+    # rounded results
     ta = trapezoidal_integration(a4v_minus_hst)
-    aat = sum(max(0, v) for v in a4v_minus_hst)  # trapezoidal_integration?
+    aat = sum(max(0, v) for v in a4v_minus_hst)
     thsa = sum(NHSA)
     a4vSS = sum(a4v)
 
@@ -223,6 +253,7 @@ ARGUMENTS
     ids_key = "(model, segi, chain), resi, oneletter"
     ids_all = iterate_to_list(f"({selection}) & guide", ids_key, _self=_self)
     data = {}
+    scores_cache = {}
 
     def gen_chain_ranges():
         i, prev = -1, ()
@@ -235,8 +266,11 @@ ARGUMENTS
 
     for ids in gen_chain_ranges():
         seq = "".join(idtuple[-1] for idtuple in ids)
-        agg = aggrescan1d_scores(seq)
-        table = agg.pop("table")
+        # homo-oligomers have the same sequence in every chain
+        if seq not in scores_cache:
+            agg = aggrescan1d_scores(seq)
+            scores_cache[seq] = (agg.pop("table"), agg)
+        table, agg = scores_cache[seq]
         assert len(ids) == len(table[key])
         data.update(zip(ids, table[key]))
 
@@ -7,6 +7,8 @@ License: BSD-2-Clause
 if not __name__.endswith('.fitting'):
     raise Exception("Must do 'import psico.fitting' instead of 'run ...'")
 
+import re
+
 from pymol import cmd, CmdException
 
 from .mcsalign import mcsalign  # noqa: F401
@@ -14,6 +16,15 @@ from .mcsalign import mcsalign  # noqa: F401
 ALL_STATES = 0
 CURRENT_STATE = -1
 
+_RE_TM_SCORE = re.compile(r'TM-score\s*=\s*(\d*\.\d*)')
+
+_RE_DYNDOM_DOMAIN = re.compile(r'DOMAIN NUMBER: *(\d+) \(coloured (\w+)')
+_RE_DYNDOM_RESI = re.compile(r'RESIDUE NUMBERS :(.*)')
+_RE_DYNDOM_BEND = re.compile(r'BENDING RESIDUES:(.*)')
+
+# DynDom residue list "1 - 10 , 20 - 30" to PyMOL "1-10+20-30"
+_DYNDOM_RESI_TRANS = str.maketrans({',': '+', ' ': None})
+
 
 def alignwithanymethod(mobile, target, methods=None, async_=1, quiet=1,
         *, _self=cmd, **kwargs):
@@ -32,6 +43,7 @@ ARGUMENTS
     arguments "mobile" and "target" (in any order) {default: align super
     cealign tmalign theseus}
     '''
+    import inspect
     import threading
     import time
     if methods is None:
@@ -41,15 +53,31 @@ ARGUMENTS
     async_, quiet = int(kwargs.pop('async', async_)), int(quiet)
     mobile_obj = _self.get_object_list('first (' + mobile + ')')[0]
 
+    def accepts_self(func):
+        try:
+            return '_self' in inspect.signature(func).parameters
+        except (TypeError, ValueError):
+            return False
+
     def myalign(method):
+        func = _self.keyword[method][0]
         newmobile = _self.get_unused_name(mobile_obj + '_' + method)
         _self.create(newmobile, mobile_obj)
         start = time.time()
-        _self.do('%s mobile=%s in %s, target=%s' % (method, newmobile, mobile, target))
+        if accepts_self(func):
+            try:
+                func(mobile='%s in %s' % (newmobile, mobile), target=target, _self=_self)
+            except Exception as e:
+                # like cmd.do, report the error and go on with other methods
+                print('Error: %s: %s' % (method, e))
+                return
+        else:
+            # any other command which takes "mobile" and "target"
+            _self.do('%s mobile=%s in %s, target=%s' % (method, newmobile, mobile, target))
         if not quiet:
             print('Finished: %s (%.2f sec)' % (method, time.time() - start))
     for method in methods:
-        if method not in cmd.keyword:
+        if method not in _self.keyword:
             if not quiet:
                 print('No such method:', method)
             continue
@@ -87,7 +115,8 @@ ARGUMENTS
     at first TER record {default: 0}
     '''
     import pymol.exporting
-    import subprocess, tempfile, os, re
+    import subprocess, tempfile, os
+    from itertools import compress
     from .exporting import save_pdb_without_ter
 
     ter, quiet = int(ter), int(quiet)
@@ -111,46 +140,60 @@ ARGUMENTS
     try:
         process = subprocess.Popen(args, stdout=subprocess.PIPE,
                 universal_newlines=True)
-        lines = process.stdout.readlines()
     except OSError:
-        raise CmdException('Cannot execute "%s", please provide full path to TMscore or TMalign executable' % (exe))
-    finally:
         os.remove(mobile_filename)
         os.remove(target_filename)
+        raise CmdException('Cannot execute "%s", please provide full path to TMscore or TMalign executable' % (exe))
 
-    # TMalign >= 2012/04/17
-    if os.path.exists(matrix_filename):
-        lines += open(matrix_filename).readlines()
-        os.remove(matrix_filename)
+    def gen_lines():
+        # parse stdout while TMalign is still writing it, closing the
+        # pipe and waiting for the process on exit
+        with process:
+            yield from process.stdout
+
+        # TMalign >= 2012/04/17
+        try:
+            with open(matrix_filename) as handle:
+                data = handle.read()
+        except FileNotFoundError:
+            return
+        yield from data.splitlines(keepends=True)
 
     r = None
-    re_score = re.compile(r'TM-score\s*=\s*(\d*\.\d*)')
     rowcount = 0
     matrix = []
-    line_it = iter(lines)
+    line_it = gen_lines()
     headercheck = False
     alignment = []
-    for line in line_it:
-        if 4 >= rowcount > 0:
-            if rowcount >= 2:
-                a = list(map(float, line.split()))
-                matrix.extend(a[2:5])
-                matrix.append(a[1])
-            rowcount += 1
-        elif not headercheck and line.startswith(' * '):
-            a = line.split(None, 2)
-            if len(a) == 3:
-                headercheck = a[1]
-        elif line.lower().startswith(' -------- rotation matrix'):
-            rowcount = 1
-        elif line.startswith('(":" denotes'):
-            alignment = [next(line_it).rstrip() for i in range(3)]
-        else:
-            match = re_score.search(line)
-            if match is not None:
-                r = float(match.group(1))
-        if not quiet:
-            print(line.rstrip())
+    try:
+        for line in line_it:
+            if 4 >= rowcount > 0:
+                if rowcount >= 2:
+                    a = list(map(float, line.split()))
+                    matrix.extend(a[2:5])
+                    matrix.append(a[1])
+                rowcount += 1
+            elif not headercheck and line.startswith(' * '):
+                a = line.split(None, 2)
+                if len(a) == 3:
+                    headercheck = a[1]
+            elif line.lower().startswith(' -------- rotation matrix'):
+                rowcount = 1
+            elif line.startswith('(":" denotes'):
+                alignment = [next(line_it).rstrip() for i in range(3)]
+            elif 'TM-score' in line:
+                match = _RE_TM_SCORE.search(line)
+                if match is not None:
+                    r = float(match.group(1))
+            if not quiet:
+                print(line.rstrip())
+    finally:
+        # waits for the process if parsing failed before the end of stdout
+        line_it.close()
+        os.remove(mobile_filename)
+        os.remove(target_filename)
+        if os.path.exists(matrix_filename):
+            os.remove(matrix_filename)
 
     if not quiet:
         for i in range(0, len(alignment[0]) - 1, 78):
@@ -169,18 +212,17 @@ ARGUMENTS
     if object is not None:
         mobile_idx, target_idx = [], []
         space = {'mobile_idx': mobile_idx, 'target_idx': target_idx}
-        _self.iterate_state(mobile_state, mobile_ca_sele, 'mobile_idx.append("%s`%d" % (model, index))', space=space)
-        _self.iterate_state(target_state, target_ca_sele, 'target_idx.append("%s`%d" % (model, index))', space=space)
-        for i, aa in enumerate(alignment[0]):
-            if aa == '-':
-                mobile_idx.insert(i, None)
-        for i, aa in enumerate(alignment[2]):
-            if aa == '-':
-                target_idx.insert(i, None)
-        if (len(mobile_idx) == len(target_idx) == len(alignment[2])):
+        _self.iterate_state(mobile_state, mobile_ca_sele, 'mobile_idx.append((model, index))', space=space)
+        _self.iterate_state(target_state, target_ca_sele, 'target_idx.append((model, index))', space=space)
+        if (alignment[0].count('-') + len(mobile_idx) ==
+                alignment[2].count('-') + len(target_idx) == len(alignment[2])):
+            mobile_it, target_it = iter(mobile_idx), iter(target_idx)
+            mobile_idx = [None if aa == '-' else next(mobile_it) for aa in alignment[0]]
+            target_idx = [None if aa == '-' else next(target_it) for aa in alignment[2]]
+            keep = [m in ':.' for m in alignment[1]]
             _self.rms_cur(
-                    ' '.join(idx for (idx, m) in zip(mobile_idx, alignment[1]) if m in ':.'),
-                    ' '.join(idx for (idx, m) in zip(target_idx, alignment[1]) if m in ':.'),
+                    ' '.join('%s`%d' % idx for idx in compress(mobile_idx, keep)),
+                    ' '.join('%s`%d' % idx for idx in compress(target_idx, keep)),
                     cycles=0, matchmaker=4, object=object)
         else:
             print('Could not load alignment object')
@@ -195,7 +237,6 @@ ARGUMENTS
 
 
 def dyndom_parse_info(filename, selection='(all)', quiet=0, *, _self=cmd):
-    import re
     fixed = False
     fixed_name = None
     dom_nr = 0
@@ -208,16 +249,17 @@ def dyndom_parse_info(filename, selection='(all)', quiet=0, *, _self=cmd):
         if line.startswith('MOVING DOMAIN'):
             fixed = False
             continue
-        m = re.match(r'DOMAIN NUMBER: *(\d+) \(coloured (\w+)', line)
-        if m:
-            dom_nr = m.group(1)
-            color = m.group(2)
+        if line.startswith('DOMAIN NUMBER:'):
+            m = _RE_DYNDOM_DOMAIN.match(line)
+            if m:
+                dom_nr = m.group(1)
+                color = m.group(2)
+            continue
+        if not line.startswith(('RESIDUE NUMBERS :', 'BENDING RESIDUES:')):
             continue
-        m = re.match(r'RESIDUE NUMBERS :(.*)', line)
+        m = _RE_DYNDOM_RESI.match(line)
         if m:
-            resi = m.group(1)
-            resi = resi.replace(',', '+')
-            resi = resi.replace(' ', '')
+            resi = m.group(1).translate(_DYNDOM_RESI_TRANS)
             if not quiet:
                 print('Domain ' + dom_nr + ' (' + color + '): resi ' + resi)
             name = 'domain_' + dom_nr
@@ -226,12 +268,9 @@ def dyndom_parse_info(filename, selection='(all)', quiet=0, *, _self=cmd):
             if fixed:
                 fixed_name = name
             continue
-        m = re.match(r'BENDING RESIDUES:(.*)', line)
+        m = _RE_DYNDOM_BEND.match(line)
         if m:
-            resi = m.group(1)
-            resi = resi.replace(',', '+')
-            resi = resi.replace(' ', '')
-            bending.append(resi)
+            bending.append(m.group(1).translate(_DYNDOM_RESI_TRANS))
     if len(bending) > 0:
         name = 'bending'
         _self.select(name, '(%s) and (resi %s)' % (selection, '+'.join(bending)), 0)
@@ -349,13 +388,32 @@ DESCRIPTION
     return ts
 
 
+_rmsd_func = None
+
+
 def get_rmsd_func():
     '''
 DESCRIPTION
 
-    API only. Returns a function that uses either numpy (fast) or chempy.cpv
-    (slow) to calculate the rmsd fit of two nx3 arrays.
+    API only. Returns a function that uses either numba (fastest), numpy
+    (fast) or chempy.cpv (slow) to calculate the rmsd fit of two nx3 arrays.
     '''
+    global _rmsd_func
+    if _rmsd_func is None:
+        _rmsd_func = _make_rmsd_func()
+    return _rmsd_func
+
+
+def _make_rmsd_func():
+    try:
+        from numpy import ascontiguousarray
+        from ._jit import rmsd
+
+        rmsd.array = lambda x: ascontiguousarray(x, dtype=float)
+        return rmsd
+    except ImportError:
+        pass
+
     try:
         # this is much faster than cpv.fit
         from numpy import dot, sqrt, array
@@ -367,7 +425,7 @@ DESCRIPTION
             R_x = (X**2).sum()
             R_y = (Y**2).sum()
             L = svd(dot(Y.T, X))[1]
-            return sqrt((R_x + R_y - 2 * L.sum()) / len(X))
+            return sqrt(max(R_x + R_y - 2 * L.sum(), 0.0) / len(X))
         rmsd.array = array
     except ImportError:
         from chempy import cpv
@@ -378,6 +436,42 @@ DESCRIPTION
     return rmsd
 
 
+def _local_rmsd(X, Y, i_from, i_to):
+    '''
+DESCRIPTION
+
+    API only. Calculates the rmsd fit of the windows X[i:j+1] and Y[i:j+1]
+    for all (i, j) in zip(i_from, i_to). Window sums are taken from prefix
+    sums and all windows are solved with a single batched SVD (or the
+    numba kernel, if available).
+    '''
+    import numpy
+
+    i_from = numpy.asarray(i_from, dtype=int)
+    i_to = numpy.asarray(i_to, dtype=int) + 1
+    n = i_to - i_from
+
+    def window_sum(A):
+        C = numpy.zeros((len(A) + 1,) + A.shape[1:])
+        numpy.cumsum(A, axis=0, out=C[1:])
+        return C[i_to] - C[i_from]
+
+    mean_x = window_sum(X) / n[:, None]
+    mean_y = window_sum(Y) / n[:, None]
+    R_x = window_sum((X**2).sum(1)) - n * (mean_x**2).sum(1)
+    R_y = window_sum((Y**2).sum(1)) - n * (mean_y**2).sum(1)
+    M = window_sum(Y[:, :, None] * X[:, None, :]) - \
+        n[:, None, None] * mean_y[:, :, None] * mean_x[:, None, :]
+
+    try:
+        from ._jit import sv_sum_batch
+        L_sum = sv_sum_batch(numpy.ascontiguousarray(M))
+    except ImportError:
+        L_sum = numpy.linalg.svd(M, compute_uv=False).sum(1)
+
+    return numpy.sqrt(numpy.clip((R_x + R_y - 2 * L_sum) / n, 0, None))
+
+
 class MatchMaker(object):
     '''
 DESCRIPTION
@@ -457,18 +551,24 @@ RESULT
         # need to pick those columns that have no gap in any of the two
         # given selections
 
-        mobileidx = set(self._self.index(mobile))
-        targetidx = set(self._self.index(target))
+        mobileidx = frozenset(self._self.index(mobile))
+        targetidx = frozenset(self._self.index(target))
         mobileidxsel = []
         targetidxsel = []
 
         for column in self._self.get_raw_alignment(aln_obj):
-            mobiles = mobileidx.intersection(column)
-            if len(mobiles) == 1:
-                targets = targetidx.intersection(column)
-                if len(targets) == 1:
-                    mobileidxsel.extend(mobiles)
-                    targetidxsel.extend(targets)
+            m = t = None
+            mcount = tcount = 0
+            for idx in column:
+                if idx in mobileidx:
+                    m = idx
+                    mcount += 1
+                if idx in targetidx:
+                    t = idx
+                    tcount += 1
+            if mcount == 1 and tcount == 1:
+                mobileidxsel.append(m)
+                targetidxsel.append(t)
 
         self.mobile = self._self.get_unused_name('_mobile')
         self.target = self._self.get_unused_name('_target')
@@ -535,14 +635,20 @@ ARGUMENTS
       * none: assume same number of atoms in both selections
       * name of alignment object: take sequence alignment from object
 
+NOTE
+
+    A window needs at least max(3, window // 4 + 1) atoms. Residues with
+    fewer atoms in their window (e.g. next to gaps, or any residue with
+    window = 2) get no RMS value (b = -1). Older versions also fitted
+    two-atom windows.
+
 EXAMPLE
 
     fetch 2x19 2xwu, async=0
     remove not chain B or not polymer
     local_rms 2x19, 2xwu, 40
     '''
-    rmsd = get_rmsd_func()
-    array = rmsd.array
+    from numpy import array, arange, full, where, minimum, maximum
 
     window = int(window)
     mobile_state, target_state = int(mobile_state), int(target_state)
@@ -563,31 +669,46 @@ EXAMPLE
     seq_start = model_mobile.atom[0].resi_number
     seq_end = model_mobile.atom[-1].resi_number
 
-    resv2i = dict((a.resi_number, i) for (i, a) in enumerate(model_mobile.atom))
+    resv_atoms = array([a.resi_number for a in model_mobile.atom], dtype=int)
     resv2b = dict()
 
     X_mobile = array(model_mobile.get_coord_list())
     X_target = array(model_target.get_coord_list())
 
-    for resv in range(seq_start, seq_end + 1):
-        for resv_from in range(resv - w2, resv + 1):
-            i_from = resv2i.get(resv_from)
-            if i_from is not None:
-                break
-        for resv_to in range(resv + w2, resv - 1, -1):
-            i_to = resv2i.get(resv_to)
-            if i_to is not None:
-                break
-        if i_from is None or i_to is None:
-            continue
-        if i_to - i_from < w4:
-            continue
-
-        x = X_mobile[i_from:i_to + 1]
-        y = X_target[i_from:i_to + 1]
-        resv2b[resv] = rmsd(x, y)
+    # dense residue number -> atom index lookup (-1 for missing residues)
+    resv_min = min(resv_atoms.min(), seq_start - w2)
+    resv_max = max(resv_atoms.max(), seq_end + w2)
+    resv2i = full(resv_max - resv_min + 1, -1, dtype=int)
+    resv2i[resv_atoms - resv_min] = arange(len(resv_atoms))
+
+    # nearest present residue at or after / at or before every position
+    present = resv2i != -1
+    pos = arange(len(resv2i))
+    pos_next = minimum.accumulate(where(present, pos, len(pos))[::-1])[::-1]
+    pos_prev = maximum.accumulate(where(present, pos, -1))
+
+    resv_list = arange(seq_start, seq_end + 1)
+    p = resv_list - resv_min
+    p_from = pos_next[p - w2]
+    p_to = pos_prev[p + w2]
+    mask = (p_from <= p) & (p_to >= p)
+    i_from_list = resv2i[p_from[mask]]
+    i_to_list = resv2i[p_to[mask]]
+    resv_list = resv_list[mask]
+
+    # skip windows with less than 3 atoms, two points only give the
+    # difference of their distances, not a meaningful local superposition
+    mask = i_to_list - i_from_list >= max(w4, 2)
+    i_from_list, i_to_list = i_from_list[mask], i_to_list[mask]
+    resv_list = resv_list[mask]
+    windows = list(zip(resv_list.tolist(), i_from_list.tolist(), i_to_list.tolist()))
+
+    if windows:
+        rms_list = _local_rmsd(X_mobile, X_target, i_from_list, i_to_list)
+        resv2b.update(zip(resv_list.tolist(), rms_list.tolist()))
 
-        if not quiet:
+    if not quiet:
+        for resv, i_from, i_to in windows:
             print(' resi %4d: RMS = %6.3f (%4d atoms)' % (resv, resv2b[resv], i_to - i_from + 1))
 
     if load_b:
@@ -669,10 +790,11 @@ DESCRIPTION
     Helper function for theseus and intra_theseus
     '''
     import subprocess, os
+    import numpy
 
-    translations = []
-    rotations = []
-    t_type = float
+    t_text = []
+    R_text = []
+    t_sign = 1.0
 
     try:
         if quiet:
@@ -681,10 +803,10 @@ DESCRIPTION
             import re
             unesc = re.compile('\x1b' + r'\[[\d;]+m').sub
 
-            process = subprocess.Popen(args, cwd=tempdir, stdout=subprocess.PIPE,
-                    universal_newlines=True)
-            for line in process.stdout:
-                print(unesc('', line.rstrip()))
+            with subprocess.Popen(args, cwd=tempdir, stdout=subprocess.PIPE,
+                    universal_newlines=True) as process:
+                for line in process.stdout:
+                    print(unesc('', line.rstrip()))
 
         filename = os.path.join(tempdir, 'theseus_transf2.txt')
 
@@ -694,17 +816,22 @@ DESCRIPTION
             if not os.path.exists(filename):
                 raise CmdException('no theseus_transf2.txt or '
                         'theseus_transf.txt output file')
+            t_sign = -1.0
+
+        with open(filename) as handle:
+            lines = handle.read().splitlines()
 
-            def t_type(t):
-                return float(t) * -1.
+        for line in lines:
+            tag = line[10:13]
+            if tag == ' t:':
+                t_text.append(line[13:])
+            elif tag == ' R:':
+                R_text.append(line[13:])
 
-        handle = open(filename)
-        for line in handle:
-            if line[10:13] == ' t:':
-                translations.append(list(map(t_type, line[13:].split())))
-            elif line[10:13] == ' R:':
-                rotations.append(list(map(float, line[13:].split())))
-        handle.close()
+        # parse all states at once
+        translations = numpy.fromstring(' '.join(t_text), sep=' ').reshape((-1, 3))
+        rotations = numpy.fromstring(' '.join(R_text), sep=' ').reshape((-1, 9))
+        translations *= t_sign
 
     except OSError:
         raise CmdException('Cannot execute "%s"' % (args[0]))
@@ -715,7 +842,7 @@ DESCRIPTION
         elif not quiet:
             print(' Not deleting temporary directory:', tempdir)
 
-    return translations, rotations
+    return translations.tolist(), rotations.tolist()
 
 
 def theseus(mobile, target, match='align', cov=0, cycles=200,
@@ -821,8 +948,8 @@ SEE ALSO
 
     # intra fit states
     obj_list = _self.get_object_list(selection)
-    for i, m in enumerate(matrices):
-        for obj in obj_list:
+    for obj in obj_list:
+        for i, m in enumerate(matrices):
             _self.transform_object(obj, m, i + 1, transpose=1)
 
     # fit back to given state
@@ -944,8 +1071,9 @@ SEE ALSO
 
     intra_xfit, align, super, fit, cealign, theseus
     '''
-    from numpy import asarray, identity, log, dot, zeros
-    from csb.bio.utils import distance_sq, wfit, fit
+    from numpy import (asarray, identity, log, dot, zeros, ones, empty,
+            einsum, matmul, reciprocal, sqrt, subtract)
+    from csb.bio.utils import wfit, fit
     from . import querying
 
     cycles, quiet = int(cycles), int(quiet)
@@ -971,26 +1099,40 @@ SEE ALSO
     else:
         R, t = fit(X, Y)
 
+    # buffer for the transformed target coordinates, and X in buffer
+    # precision, so matmul doesn't cast X every cycle
+    XR = empty(X.shape)
+    X64 = X.astype(float)
+
+    def distance_sq_transformed(R, t):
+        # same as distance_sq(Y, dot(X - t, R)), without temporaries
+        matmul(X64, R, out=XR)
+        subtract(XR, dot(t, R), out=XR)
+        subtract(XR, Y, out=XR)
+        return einsum('ij,ij->i', XR, XR)
+
     if int(bfit):
         # adapted from csb.apps.bfit
 
-        from csb.bio.utils import distance, probabilistic_fit
+        from csb.bio.utils import probabilistic_fit
         from csb.statistics.scalemixture import ScaleMixture
 
         mixture = ScaleMixture(scales=X.shape[0],
                 prior=_bfit_get_prior(distribution), d=3)
 
         for _ in range(cycles):
-            data = distance(Y, dot(X - t, R))
+            data = sqrt(distance_sq_transformed(R, t))
             mixture.estimate(data)
             R, t = probabilistic_fit(X, Y, mixture.scales)
 
         scales = mixture.scales
 
     else:
+        scales = ones(len(X))
+
         for _ in range(cycles):
-            data = distance_sq(Y, dot(X - t, R))
-            scales = 1.0 / data.clip(1e-3)
+            data = distance_sq_transformed(R, t)
+            reciprocal(data.clip(1e-3, out=data), out=scales)
             R, t = wfit(X, Y, scales)
 
     m = identity(4)
@@ -999,7 +1141,7 @@ SEE ALSO
     _self.transform_object(mobile_obj, list(m.flat))
 
     if int(load_b):
-        b_iter = iter(-log(scales))
+        b_iter = iter((-log(scales)).tolist())
         _self.alter(mm.mobile, 'b = next(b_iter)', space={'b_iter': b_iter, 'next': next})
 
     if not quiet:
@@ -1033,7 +1175,7 @@ SEE ALSO
 
     xfit, intra_fit, intra_theseus
     '''
-    from numpy import asarray, identity, log, dot, zeros
+    from numpy import asarray, identity, log, zeros, empty, matmul, einsum, sqrt
     from csb.bio.utils import wfit, fit
     from .querying import get_ensemble_coords
 
@@ -1060,10 +1202,29 @@ SEE ALSO
 
     R, t = [identity(3)] * n_models, [zeros(3)] * n_models
 
+    def wfit_all(average, scales):
+        for i in range(n_models):
+            R[i], t[i] = wfit(X[i], average, scales)
+
+    try:
+        from ._jit import apply_transforms, mean_var_sum
+    except ImportError:
+        def apply_transforms(X, R, t, out):
+            matmul(X - t[:, None], R, out=out)
+
+        def mean_var_sum(ensemble):
+            # single pass over the ensemble (sum and sum of squares)
+            mean = ensemble.sum(0) / n_models
+            sq = einsum('mnd,mnd->nd', ensemble, ensemble) / n_models
+            return mean, (sq - mean**2).sum(1).clip(0)
+
+    # transformed coordinates of all states
+    ensemble = empty(X.shape)
+
     if int(bfit):
         # adapted from csb.apps.bfite
 
-        from csb.bio.utils import average_structure, distance
+        from csb.bio.utils import average_structure
         from csb.statistics.scalemixture import ScaleMixture
 
         average = average_structure(X)
@@ -1075,51 +1236,55 @@ SEE ALSO
             R[i], t[i] = fit(X[i], average)
 
         for _ in range(cycles):
-            data = asarray([distance(average, dot(X[i] - t[i], R[i])) for i in range(n_models)])
+            apply_transforms(X, asarray(R), asarray(t), ensemble)
+            ensemble -= average
+            data = sqrt(einsum('mnd,mnd->mn', ensemble, ensemble))
             mixture.estimate(data.T)
-            for i in range(n_models):
-                R[i], t[i] = wfit(X[i], average, mixture.scales)
+            wfit_all(average, mixture.scales)
 
         scales = mixture.scales
 
     else:
         if int(seed):
-            ensemble = X
+            ensemble[:] = X
         else:
-            ensemble = []
             for i in range(n_models):
                 R[i], t[i] = fit(X[i], X[0])
-                ensemble.append(dot(X[i] - t[i], R[i]))
+            apply_transforms(X, asarray(R), asarray(t), ensemble)
 
         for _ in range(cycles):
-            ensemble = asarray(ensemble)
-            average = ensemble.mean(0)
-            data = ensemble.var(0).sum(1)
+            average, data = mean_var_sum(ensemble)
             scales = 1.0 / data.clip(1e-3)
 
-            ensemble = []
-            for i in range(n_models):
-                R[i], t[i] = wfit(X[i], average, scales)
-                ensemble.append(dot(X[i] - t[i], R[i]))
+            wfit_all(average, scales)
+            apply_transforms(X, asarray(R), asarray(t), ensemble)
+
+    # all state matrices at once (row-major 4x4, translation in last row)
+    m = zeros((n_models, 4, 4))
+    m[:, 0:3, 0:3] = asarray(R).transpose(0, 2, 1)
+    m[:, 3, 0:3] = -asarray(t)
+    m[:, 3, 3] = 1
+    m = m.reshape((n_models, 16)).tolist()
 
-    m = identity(4)
     back = identity(4)
     back[0:3, 0:3] = R[0]
     back[0:3, 3] = t[0]
+    back = back.flatten().tolist()
+
+    if int(load_b):
+        b_list = (-log(scales)).tolist()
 
     transformation_i = 0
     for mobile_obj, n_states in zip(mobile_objs, n_states_objs):
         for state_i in range(n_states):
-            m[0:3, 0:3] = R[transformation_i].T
-            m[3, 0:3] = -t[transformation_i]
-            _self.transform_object(mobile_obj, list(m.flat), state=state_i + 1)
+            _self.transform_object(mobile_obj, m[transformation_i], state=state_i + 1)
             transformation_i += 1
 
         # fit back to first state
-        _self.transform_object(mobile_obj, list(back.flat), state=0)
+        _self.transform_object(mobile_obj, back, state=0)
 
         if int(load_b):
-            b_iter = iter(-log(scales))
+            b_iter = iter(b_list)
             _self.alter('({}) & {} & state 1'.format(selection, mobile_obj),
                       'b = next(b_iter)',
                       space={'b_iter': b_iter, 'next': next})
@@ -1312,6 +1477,9 @@ ARGUMENTS
 
     objects = _self.get_object_list(selection)
 
+    # box center in cartesian space, per unit cell (usually constant)
+    boxcenter_cache = {}
+
     for state in range(1, _self.count_states(selection) + 1):
         selecenter = _self.get_coords(selection, state).mean(0)
 
@@ -1321,9 +1489,14 @@ ARGUMENTS
             if not sym:
                 raise CmdException("no symmetry")
 
-            basis = cellbasis(sym[3:6], sym[0:3])[:3, :3]
+            key = tuple(sym[:6])
+            boxcenter = boxcenter_cache.get(key)
+            if boxcenter is None:
+                basis = cellbasis(sym[3:6], sym[0:3])[:3, :3]
+                boxcenter = boxcenter_cache[key] = dot(basis, center)
+
             cset = _self.get_coordset(obj, state, copy=0)
-            cset += dot(basis, center) - selecenter
+            cset += boxcenter - selecenter
 
     _self.rebuild(selection)
 
@@ -1347,6 +1520,7 @@ ARGUMENTS
     objects = _self.get_object_list(selection)
     center = _self.get_coords(selection, state).mean(0)
 
+    # one state at a time, trajectories may not fit into memory at once
     for state in range(1, _self.count_states(selection) + 1):
         offset = center - _self.get_coords(selection, state).mean(0)
         offset = offset.tolist()
@@ -54,7 +54,7 @@ SEE ALSO
     http://pymolwiki.org/index.php/FindSeq
     '''
     import re
-    from chempy import cpv
+    from numpy import asarray
 
     if not one_letter:
         _assert_package_import()
@@ -63,20 +63,39 @@ SEE ALSO
     state, quiet = int(state), int(quiet)
     cutoff = float(cutoff)
 
-    seq_list = []
-    idx_list = []
-    prev = [1e300, 1e300, 1e300]
-
-    def callback(model, index, resn, coord):
-        if cpv.distance(coord, prev) > cutoff:
-            seq_list.append('#')
-            idx_list.append(None)
-        seq_list.append(one_letter.get(resn, '#'))
-        idx_list.append((model, index))
-        prev[:] = coord
-
+    models = []
+    indices = []
+    resns = []
+    coords = []
     _self.iterate_state(state, '(%s) and guide' % (selection),
-            'callback(model, index, resn, (x, y, z))', space=locals())
+            'models.append(model); indices.append(index); resns.append(resn);'
+            'coords.append((x, y, z))', space={'models': models,
+                'indices': indices, 'resns': resns, 'coords': coords})
+
+    # chain breaks (squared distance to previous residue), first is a break
+    gaps = [True] * len(models)
+    if len(models) > 1:
+        d = asarray(coords)
+        d = d[1:] - d[:-1]
+        gaps[1:] = ((d * d).sum(1) > cutoff**2).tolist()
+
+    # parallel per-position lists, gap positions have model None
+    seq_list = []
+    model_list = []
+    index_list = []
+    seq_append = seq_list.append
+    model_append = model_list.append
+    index_append = index_list.append
+    one_letter_get = one_letter.get
+
+    for model, index, resn, gap in zip(models, indices, resns, gaps):
+        if gap:
+            seq_append('#')
+            model_append(None)
+            index_append(-1)
+        seq_append(one_letter_get(resn, '#'))
+        model_append(model)
+        index_append(index)
 
     matches = list(re.finditer(pattern.upper(), ''.join(seq_list)))
     if not quiet:
@@ -85,12 +104,25 @@ SEE ALSO
         else:
             print(' select_pepseq: Pattern found %d time(s)' % (len(matches)))
 
-    sel_list = []
+    per_model = {}
     for m in matches:
         start, stop = m.span()
-        sel_list.extend('%s`%d' % idx for idx in idx_list[start:stop] if idx is not None)
+        for model, index in zip(model_list[start:stop], index_list[start:stop]):
+            if model is not None:
+                per_model.setdefault(model, []).append(index)
 
-    return _self.select(name, '(' + selection + ') and byres (none ' + ' '.join(sel_list) + ')')
+    # one index list selection per model instead of a model`index expression
+    tmp_names = []
+    try:
+        for model, indices in per_model.items():
+            tmp_name = _self.get_unused_name('_pepseq')
+            _self.select_list(tmp_name, model, indices, mode='index')
+            tmp_names.append(tmp_name)
+
+        return _self.select(name, '(' + selection + ') and byres (none ' + ' '.join(tmp_names) + ')')
+    finally:
+        for tmp_name in tmp_names:
+            _self.delete(tmp_name)
 
 
 def select_nucseq(pattern, selection='all', name='sele', state=1, quiet=1, *, _self=cmd):
@@ -127,20 +159,20 @@ ARGUMENTS
     _self.iterate('bycalpha (%s)' % (selection),
             'qkeys.add(((model,segi,chain,ss), resv))', space={'qkeys': qkeys})
 
-    def in_intervals(i, intervals):
-        for interval in intervals:
-            if interval[0] <= i <= interval[1]:
-                return True
-        return False
+    # residue numbers of all CA atoms per (model,segi,chain,ss), in one pass
+    resv_sets = dict()
+    _self.iterate('(byobj (%s)) and name CA' % (selection),
+            'resv_sets.setdefault((model,segi,chain,ss), set()).add(resv)',
+            space={'resv_sets': resv_sets})
 
     elements = dict()
+    covered = dict()
     for key, resv in qkeys:
         element = elements.setdefault(key, [])
-        if in_intervals(resv, element):
+        covered_key = covered.setdefault(key, set())
+        if resv in covered_key:
             continue
-        resv_set = set()
-        _self.iterate('/%s/%s/%s//CA and ss "%s"' % key, 'resv_set.add(resv)',
-                space={'resv_set': resv_set})
+        resv_set = resv_sets[key]
         resv_min = resv
         resv_max = resv
         while (resv_min - 1) in resv_set:
@@ -148,6 +180,7 @@ ARGUMENTS
         while (resv_max + 1) in resv_set:
             resv_max += 1
         element.append((resv_min, resv_max))
+        covered_key.update(range(resv_min, resv_max + 1))
 
     sele_list = []
     ss_names = {'S': 'Strand', 'H': 'Helix', '': 'Loop', 'L': 'Loop'}
@@ -157,6 +190,11 @@ ARGUMENTS
             sele = '/%s/%s/%s/%d-%d' % (model, segi, chain, resv_min, resv_max)
             if caonly:
                 sele += '/CA'
+            # blank identifiers are wildcards in the macro
+            blank = ''.join(" & %s ''" % (k) for (k, v) in
+                            [('segi', segi), ('chain', chain)] if not v)
+            if blank:
+                sele = '(%s%s)' % (sele, blank)
             sele_list.append(sele)
             if not quiet:
                 print("%-6s %s" % (ss_names.get(ss, ss), sele))
@@ -249,18 +287,18 @@ ARGUMENTS
     selection = string: atom selection {default: (sele)}
     '''
     from collections import defaultdict
+    from numpy import fromiter, diff, flatnonzero
     s_dict = defaultdict(set)
     _self.iterate(selection, 's_dict[model,segi,chain].add(resv)', space=locals())
     r_all = []
     for key, s in s_dict.items():
-        s = sorted(s)
-        r = [[s[0], s[0]]]
-        for i in s[1:]:
-            if i <= r[-1][1] + 1:
-                r[-1][1] = i
-            else:
-                r.append([i, i])
-        resi = '+'.join(('%d-%d' % (f, t) if f != t else '%d' % (f)) for (f, t) in r)
+        a = fromiter(s, dtype=int, count=len(s))
+        a.sort()
+        # runs of consecutive residue numbers
+        breaks = flatnonzero(diff(a) != 1)
+        starts = a[:1].tolist() + a[breaks + 1].tolist()
+        ends = a[breaks].tolist() + a[-1:].tolist()
+        resi = '+'.join(('%d-%d' % (f, t) if f != t else '%d' % (f)) for (f, t) in zip(starts, ends))
         r_all.append('/%s/%s/%s/' % key + resi)
     if not int(quiet):
         for r in r_all:
@@ -317,14 +355,18 @@ SEE ALSO
                 sele_dict[idx1[0]].add(idx1[1])
                 sele_dict[idx2[0]].add(idx2[1])
 
-    _self.select(name, 'none')
-    tmp_name = _self.get_unused_name('_')
+    # one index list selection per model, like select_pepseq
+    tmp_names = []
+    try:
+        for model, indices in sele_dict.items():
+            tmp_name = _self.get_unused_name('_')
+            _self.select_list(tmp_name, model, sorted(indices), mode='index')
+            tmp_names.append(tmp_name)
 
-    r = 0
-    for model in sele_dict:
-        _self.select_list(tmp_name, model, list(sele_dict[model]), mode='index')
-        r = _self.select(name, tmp_name, merge=1)
-        _self.delete(tmp_name)
+        r = _self.select(name, 'none ' + ' '.join(tmp_names))
+    finally:
+        for tmp_name in tmp_names:
+            _self.delete(tmp_name)
 
     if not quiet:
         print(' Selector: selection "%s" defined with %d atoms.' % (name, r))
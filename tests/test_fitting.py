@@ -30,14 +30,102 @@ def test_intra_center():
         [-1.0, 1.425962, 8.287644, 7.676795])
 
 
-# def alignwithanymethod(mobile, target, methods=None, async_=1, quiet=1, **kwargs):
+def test_get_rmsd_func():
+    cmd.reinitialize()
+    cmd.load(FILENAME_MULTISTATE, "m1")
+    rmsd = psico.fitting.get_rmsd_func()
+    X = rmsd.array(cmd.get_coords("guide", 1))
+    Y = rmsd.array(cmd.get_coords("guide", 3))
+    assert rmsd(X, Y) == approx(1.6152, abs=1e-3)
+    assert rmsd(X, X.copy()) == approx(0.0, abs=1e-5)
+
+
+def test_get_rmsd_func_collinear():
+    import numpy
+    rng = numpy.random.default_rng(0)
+    X = numpy.zeros((20, 3)) + 30.0
+    X[:, 0] += numpy.arange(20) * 3.8
+    X[:, 1:] += rng.normal(size=(20, 2)) * 1e-3
+    Y = X + rng.normal(size=(20, 3)) * 1e-3
+    Xc, Yc = X - X.mean(0), Y - Y.mean(0)
+    L = numpy.linalg.svd(Yc.T @ Xc, compute_uv=False)
+    ref = numpy.sqrt(((Xc**2).sum() + (Yc**2).sum() - 2 * L.sum()) / len(X))
+    rmsd = psico.fitting.get_rmsd_func()
+    assert rmsd(rmsd.array(X), rmsd.array(Y)) == approx(ref, abs=1e-6)
+
+
+def test_local_rms():
+    cmd.reinitialize()
+    cmd.load(FILENAME_MULTISTATE, "m0")
+    cmd.create("m1", "m0", 1, 1)
+    cmd.create("m2", "m0", 3, 1)
+    cmd.remove("m1 & resi 60-61")
+    resv2b = psico.fitting.local_rms("m1", "m2", window=10)
+    assert sorted(resv2b) == list(range(52, 83))
+    b_list = psico.querying.iterate_to_list("m1 & guide", "b")
+    b_list_ref = [
+        0.0835, 0.0803, 0.0883, 0.0883, 0.0883, 0.1670, 0.1948, 0.1864,
+        0.1660, 0.1433, 0.1327, 0.1021, 0.1111, 0.1115, 0.0947, 0.0949,
+        0.1596, 0.2228, 0.2428, 0.2499, 0.5657, 1.6688, 1.7049, 1.7494,
+        1.7810, 1.7604, 1.7075, 1.5519, 1.6682
+    ]
+    assert b_list == approx(b_list_ref, abs=1e-3)
+    # windows with less than 3 atoms are skipped
+    resv2b = psico.fitting.local_rms("m1", "m2", window=2, load_b=0)
+    assert 52 not in resv2b
+    assert 82 not in resv2b
+    assert 53 in resv2b
+
+
+def test_dyndom_parse_info(tmp_path):
+    filename = tmp_path / "out_info"
+    filename.write_text("""
+FIXED  DOMAIN
+DOMAIN NUMBER:      1 (coloured blue for rasmol)
+RESIDUE NUMBERS :52 - 70 , 80 - 90
+MOVING DOMAIN
+DOMAIN NUMBER:      2 (coloured red for rasmol)
+RESIDUE NUMBERS :71 - 79
+BENDING RESIDUES:69 - 72
+BENDING RESIDUES:78 - 81
+""")
+    cmd.reinitialize()
+    cmd.load(FILENAME_MULTISTATE, "m1")
+    fixed_name = psico.fitting.dyndom_parse_info(str(filename), "m1", quiet=1)
+    assert fixed_name == "domain_1"
+    assert cmd.count_atoms("domain_1 & guide") == 22
+    assert cmd.count_atoms("domain_2 & guide") == 9
+    assert cmd.count_atoms("bending & guide") == 8
+
+
+def test_alignwithanymethod():
+    def myfit(mobile, target):
+        cmd.align(mobile, target)
+
+    def myfail(mobile, target, *, _self=cmd):
+        raise ValueError("myfail")
+
+    cmd.reinitialize()
+    cmd.load(FILENAME_MULTISTATE, "m0")
+    cmd.create("m1", "m0", 1, 1)
+    cmd.create("m2", "m0", 3, 1)
+    cmd.extend("myfit", myfit)
+    cmd.extend("myfail", myfail)
+    try:
+        # errors are reported, other methods still run
+        psico.fitting.alignwithanymethod("m1", "m2", "myfail align myfit", async_=0)
+    finally:
+        cmd.keyword.pop("myfit")
+        cmd.keyword.pop("myfail")
+    assert cmd.get_names() == ["m0", "m1", "m2", "m1_myfail01", "m1_align01", "m1_myfit01"]
+    assert cmd.rms_cur("m1_myfit01 & guide", "m2 & guide") == approx(
+        cmd.rms_cur("m1_align01 & guide", "m2 & guide"), abs=1e-3)
+
+
 # def tmalign(mobile, target, mobile_state=1, target_state=1, args='',
-# def dyndom_parse_info(filename, selection='(all)', quiet=0):
 # def dyndom(mobile, target, window=5, domain=20, ratio=1.0, exe='', transform=1,
 # def gdt_ts(mobile, target, cutoffs='1 2 4 8', quiet=1):
-# def get_rmsd_func():
 # def matchmaker(mobile, target, match):
-# def local_rms(mobile, target, window=20, mobile_state=1, target_state=1,
 # def extra_fit(selection='(all)', reference=None, method='align', zoom=1,
 # def theseus(mobile, target, match='align', cov=0, cycles=200,
 # def intra_theseus(selection, state=1, cov=0, cycles=200,
@@ -0,0 +1,101 @@
+import sys
+from pathlib import Path
+
+import numpy
+import pytest
+from pymol import cmd
+from pytest import approx
+
+import psico.aggrescanning
+import psico.fitting
+import psico.querying
+
+DATA_PATH = Path(__file__).resolve().parent / 'data'
+FILENAME_MULTISTATE = DATA_PATH / '1nmr-frag-nohydro.pdb'
+
+# compares the numba kernels with the numpy fallbacks of their callers
+_jit = pytest.importorskip('psico._jit')
+
+
+def without_jit(monkeypatch, func, *args, **kwargs):
+    """Call func with the numpy fallbacks (psico._jit not importable)"""
+    with monkeypatch.context() as m:
+        m.setitem(sys.modules, 'psico._jit', None)
+        return func(*args, **kwargs)
+
+
+def test_sv_sum_batch():
+    rng = numpy.random.default_rng(0)
+    M = rng.normal(size=(100, 3, 3))
+    # near singular: rank 1 and rank 2
+    M[:10, :, 1:] = M[:10, :, :1] * 2 + rng.normal(size=(10, 3, 2)) * 1e-6
+    M[10:20, :, 2] = M[10:20, :, 0] - M[10:20, :, 1]
+    ref = numpy.linalg.svd(M, compute_uv=False).sum(1)
+    assert _jit.sv_sum_batch(M) == approx(ref, rel=1e-12, abs=1e-12)
+
+
+def test_rmsd(monkeypatch):
+    rmsd = psico.fitting._make_rmsd_func()
+    rmsd_numpy = without_jit(monkeypatch, psico.fitting._make_rmsd_func)
+    assert rmsd is not rmsd_numpy
+    rng = numpy.random.default_rng(0)
+    X = rng.normal(size=(30, 3)) * 10
+    collinear = X.copy()
+    collinear[:, 1:] = rng.normal(size=(30, 2)) * 1e-3
+    for Y in [X[::-1], X + rng.normal(size=X.shape), collinear]:
+        assert rmsd(rmsd.array(X), rmsd.array(Y)) == approx(
+            rmsd_numpy(rmsd_numpy.array(X), rmsd_numpy.array(Y)), abs=1e-9)
+
+
+def test_apply_transforms_mean_var_sum():
+    rng = numpy.random.default_rng(0)
+    X = rng.normal(size=(5, 20, 3))
+    R = numpy.linalg.qr(rng.normal(size=(5, 3, 3)))[0]
+    t = rng.normal(size=(5, 3))
+    out = numpy.empty(X.shape)
+    _jit.apply_transforms(X, R, t, out)
+    assert out == approx(numpy.matmul(X - t[:, None], R), abs=1e-12)
+    mean, var = _jit.mean_var_sum(out)
+    assert mean == approx(out.mean(0), abs=1e-12)
+    assert var == approx(out.var(0).sum(1), abs=1e-12)
+
+
+def test_local_rms(monkeypatch):
+    cmd.reinitialize()
+    cmd.load(FILENAME_MULTISTATE, "m0")
+    cmd.create("m1", "m0", 1, 1)
+    cmd.create("m2", "m0", 3, 1)
+    cmd.remove("m1 & resi 60-61")
+    for window in [3, 4, 10, 20]:
+        resv2b = psico.fitting.local_rms("m1", "m2", window=window, load_b=0)
+        resv2b_numpy = without_jit(monkeypatch, psico.fitting.local_rms,
+                                   "m1", "m2", window=window, load_b=0)
+        assert sorted(resv2b) == sorted(resv2b_numpy)
+        assert resv2b == approx(resv2b_numpy, abs=1e-8)
+
+
+@pytest.mark.parametrize("bfit", [0, 1])
+def test_intra_xfit(monkeypatch, bfit):
+    def run(fitted):
+        cmd.reinitialize()
+        cmd.load(FILENAME_MULTISTATE, "m0")
+        numpy.random.seed(0)
+        fitted(psico.fitting.intra_xfit, "m0", load_b=1, cycles=5, bfit=bfit)
+        return (psico.querying.iterate_to_list("guide", "b"),
+                cmd.get_coords("guide", 0))
+
+    b_list, X = run(lambda func, *a, **k: func(*a, **k))
+    b_list_numpy, X_numpy = run(lambda func, *a, **k: without_jit(
+        monkeypatch, func, *a, **k))
+    assert b_list == approx(b_list_numpy, abs=1e-4)
+    assert X == approx(X_numpy, abs=1e-4)
+
+
+def test_aggrescan1d_scores(monkeypatch):
+    rng = numpy.random.default_rng(0)
+    aa = list("ACDEFGHIKLMNPQRSTVWY")
+    for n in [5, 30, 80, 200, 400]:
+        seq = "".join(rng.choice(aa, n))
+        # windows are summed in the same order, so results are identical
+        assert psico.aggrescanning.aggrescan1d_scores(seq) == without_jit(
+            monkeypatch, psico.aggrescanning.aggrescan1d_scores, seq)
@@ -1,6 +1,9 @@
 import psico.selecting
+from pathlib import Path
 from pymol import cmd
 
+DATA_PATH = Path(__file__).resolve().parent / "data"
+
 
 def test_select_range():
     cmd.reinitialize()
@@ -12,11 +15,74 @@ def test_select_range():
     assert 5 == cmd.count_atoms("s2 & guide")
 
 
-# def select_pepseq(pattern, selection='all', name='sele', state=1, quiet=1,
+def _load_two_chains():
+    # one object with two copies of ubiquitin, chain B shifted by 30 Angstrom
+    cmd.reinitialize()
+    cmd.load(DATA_PATH / "1ubq.cif.gz", "m1")
+    cmd.remove("solvent")
+    cmd.create("m2", "m1")
+    cmd.alter("m2", "chain='B'")
+    cmd.translate([30, 0, 0], "m2", camera=0)
+    cmd.create("m0", "m1 | m2")
+    cmd.delete("m1 m2")
+
+
+def test_select_pepseq():
+    _load_two_chains()
+    assert 70 == psico.selecting.select_pepseq("TLTGK", "m0", "s1")
+    assert 35 == cmd.count_atoms("s1 & chain B")
+    # does not span the chain break
+    assert 0 == psico.selecting.select_pepseq("GGMQ", "m0", "s1")
+    # does not span a gap
+    cmd.remove("chain A & resi 9 & name CA")
+    assert 35 == psico.selecting.select_pepseq("TLTGK", "m0", "s1")
+    assert 0 == cmd.count_atoms("s1 & chain A")
+
+
 # def select_nucseq(pattern, selection='all', name='sele', state=1, quiet=1):
-# def select_sspick(selection, name=None, caonly=0, quiet=0):
+
+
+def test_select_sspick():
+    _load_two_chains()
+    cmd.dss()
+    sele = psico.selecting.select_sspick("chain A & resi 3", "s1", quiet=1)
+    assert sele == "/m0/A/A/1-7"
+    assert 59 == cmd.count_atoms("s1")
+    psico.selecting.select_sspick("chain B & resi 25", "s1", quiet=1)
+    assert 98 == cmd.count_atoms("s1 & chain B")
+    assert 0 == cmd.count_atoms("s1 & chain A")
+    psico.selecting.select_sspick("resi 3 & name CA", "s1", caonly=1, quiet=1)
+    assert 7 == cmd.count_atoms("s1 & chain A")
+    assert 7 == cmd.count_atoms("s1 & chain B")
+    # blank segi and chain identifiers only match themselves
+    cmd.alter("all", "segi=''")
+    cmd.alter("chain A", "chain=''")
+    cmd.alter("chain B & resi 8-9", "ss='S'")
+    sele = psico.selecting.select_sspick("chain '' & resi 3", "s1", quiet=1)
+    assert sele == "(/m0///1-7 & segi '' & chain '')"
+    assert 59 == cmd.count_atoms("s1")
+    assert 0 == cmd.count_atoms("s1 & chain B")
+
+
 # def diff(sele1, sele2, byres=1, name=None, operator='in', quiet=0):
 # def symdiff(sele1, sele2, byres=1, name=None, operator='in', quiet=0):
-# def collapse_resi(selection='(sele)', quiet=1):
+
+
+def test_collapse_resi():
+    _load_two_chains()
+    sele = psico.selecting.collapse_resi("resi 1-5+7+9-12 & name CA")
+    assert sele == "/m0/A/A/1-5+7+9-12 /m0/A/B/1-5+7+9-12"
+    assert psico.selecting.collapse_resi("chain B & resi 10") == "/m0/A/B/10"
+
+
 # def wait_for(name, state=0, quiet=1):
-# def select_distances(names='', name='sele', state=1, selection='all', cutoff=-1, quiet=1):
+
+
+def test_select_distances():
+    _load_two_chains()
+    cmd.distance("d1", "chain A & resi 10 & name CA", "chain B & resi 20-25 & name CA")
+    cmd.distance("d2", "chain A & resi 40 & name CA", "chain A & resi 45 & name CA")
+    assert 9 == psico.selecting.select_distances("", "s1")
+    assert 3 == cmd.count_atoms("s1 & chain A")
+    assert 7 == psico.selecting.select_distances("d1", "s1")
+    assert 1 == cmd.count_atoms("s1 & chain A")